@@ -4,6 +4,7 @@ import os
 FIRE_WIDTH = int(os.environ.get("FIRE_WIDTH", 1440))
 FIRE_HEIGHT = int(os.environ.get("FIRE_HEIGHT", 960))
 MAX_INTENSITY = 255
+MAX_BRUSH_RADIUS = 400
 
 ###Presets
 # #normal
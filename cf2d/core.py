@@ -1,20 +1,39 @@
+import numpy as np
 import taichi as ti
 
 from constants import (ADD_MULT, DECAY_MULT, FIRE_HEIGHT, FIRE_WIDTH,
-                       MAX_INTENSITY)
+                       MAX_BRUSH_RADIUS, MAX_INTENSITY)
 from palettes import (palette_cold_fire, palette_cyber, palette_electric,
                       palette_fire, palette_gray, palette_sunset,
                       palette_toxic)
 
 ti.init(arch=ti.gpu)
 
+# Random bytes for spread_fire, refreshed from the host every step
+RAND_RES = 256
+_rng = np.random.default_rng()
+
 # Fire simulation field: (width, height)
-firePixels = ti.field(dtype=ti.i32, shape=(FIRE_WIDTH, FIRE_HEIGHT))
-fixedPixels = ti.field(dtype=ti.i32, shape=(FIRE_WIDTH, FIRE_HEIGHT))
-# Image: (width, height, 3)
-image = ti.field(dtype=ti.u8, shape=(FIRE_WIDTH, FIRE_HEIGHT, 3))
-# Color palette
-colors = ti.Vector.field(3, dtype=ti.u8, shape=(MAX_INTENSITY + 1))
+# Intensities never leave [0, MAX_INTENSITY], so a byte per pixel is enough
+firePixels = ti.field(dtype=ti.u8, shape=(FIRE_WIDTH, FIRE_HEIGHT))
+# Next simulation step, so do_fire never reads pixels it has already updated
+firePixels_next = ti.field(dtype=ti.u8, shape=(FIRE_WIDTH, FIRE_HEIGHT))
+# Heat summed over a batch of brush stamps before it is applied, kept at zero
+heat_delta = ti.field(dtype=ti.i32, shape=(FIRE_WIDTH, FIRE_HEIGHT))
+# Fixed-pixel mask, one byte per pixel
+fixedPixels = ti.field(dtype=ti.u8, shape=(FIRE_WIDTH, FIRE_HEIGHT))
+# Color palette, packed as Qt RGB32 pixels (0xFFRRGGBB) so presenting a pixel
+# is a single 32-bit gather
+colors = ti.field(dtype=ti.u32, shape=(MAX_INTENSITY + 1))
+# Brush falloff, indexed by squared distance from the brush center
+brush_falloff = ti.field(dtype=ti.f32, shape=(MAX_BRUSH_RADIUS * MAX_BRUSH_RADIUS + 1))
+_brush_falloff_radius = 0
+# Random bytes for spread_fire, tiled over the grid
+rand_field = ti.field(dtype=ti.u8, shape=(RAND_RES, RAND_RES))
+# Simplex corner hash ((34x + 1)x) mod 289, baked for every index it is called with
+perm_lut = ti.field(dtype=ti.i32, shape=(2 * 289))
+# Simplex gradient of perm_lut[x] for each x, so the last hash needs no permute
+grad_lut = ti.Vector.field(3, dtype=ti.f32, shape=(2 * 289))
 
 # --- Palette management ---
 
@@ -34,159 +53,258 @@ def get_palette_list():
 
 
 def set_palette(palette_func):
-    palette = palette_func()
-    for i in range(MAX_INTENSITY + 1):
-        colors[i] = palette[i]
+    # astype wraps out-of-range entries the same way per-element stores did
+    palette = np.asarray(palette_func()).astype(np.uint8).astype(np.uint32)
+    colors.from_numpy(
+        np.uint32(0xFF000000) | palette[:, 0] << 16 | palette[:, 1] << 8 | palette[:, 2]
+    )
 
 
-# Perlin noise and fire spread
-@ti.func
-def lerp(a, b, t):
-    return a * (1 - t) + b * t
+def permute_table():
+    x = np.arange(2 * 289)
+    return ((34 * x + 1) * x % 289).astype(np.int32)
 
 
-@ti.func
-def fade(t):
-    return t * t * t * (t * (t * 6 - 15) + 10)
+def gradient_table():
+    # Map each hash onto a 7x7 grid folded over an octahedron, then normalize
+    p = permute_table()
+    a = p % 49 // 7
+    b = p % 7
+    gx = a * (2.0 / 7.0) + (0.5 / 7.0 - 1.0)
+    gy = b * (2.0 / 7.0) + (0.5 / 7.0 - 1.0)
+    gz = 1.0 - np.abs(gx) - np.abs(gy)
+    # Integer form of gz <= 0 so exact ties fold the same way every time
+    fold = np.abs(4 * a - 13) + np.abs(4 * b - 13) >= 14
+    gx = np.where(fold, gx - (np.floor(gx) * 2.0 + 1.0), gx)
+    gy = np.where(fold, gy - (np.floor(gy) * 2.0 + 1.0), gy)
+    grad = np.stack([gx, gy, gz], axis=1)
+    grad *= 1.79284291400159 - 0.85373472095314 * (grad * grad).sum(axis=1)[:, None]
+    return grad.astype(np.float32)
 
 
-@ti.func
-def grad(hash, x, y, z):
-    h = hash & 15
-    u = x if h < 8 else y
-    v = y if h < 4 else (x if (h == 12 or h == 14) else z)
-    return (u if (h & 1) == 0 else -u) + (v if (h & 2) == 0 else -v)
+perm_lut.from_numpy(permute_table())
+grad_lut.from_numpy(gradient_table())
 
 
+# Simplex noise and fire spread
 @ti.func
 def permute(x):
-    return ((34 * x + 1) * x) % 289
+    return perm_lut[x]
 
 
 @ti.func
-def perlin_noise(x, y, z):
-    X = int(ti.floor(x)) & 255
-    Y = int(ti.floor(y)) & 255
-    Z = int(ti.floor(z)) & 255
-    xf = x - ti.floor(x)
-    yf = y - ti.floor(y)
-    zf = z - ti.floor(z)
-    u = fade(xf)
-    v = fade(yf)
-    w = fade(zf)
-    A = permute(X) + Y
-    AA = permute(A) + Z
-    AB = permute(A + 1) + Z
-    B = permute(X + 1) + Y
-    BA = permute(B) + Z
-    BB = permute(B + 1) + Z
-    n000 = grad(int(permute(AA)), xf, yf, zf)
-    n100 = grad(int(permute(BA)), xf - 1.0, yf, zf)
-    n010 = grad(int(permute(AB)), xf, yf - 1.0, zf)
-    n110 = grad(int(permute(BB)), xf - 1.0, yf - 1.0, zf)
-    n001 = grad(int(permute(AA + 1)), xf, yf, zf - 1.0)
-    n101 = grad(int(permute(BA + 1)), xf - 1.0, yf, zf - 1.0)
-    n011 = grad(int(permute(AB + 1)), xf, yf - 1.0, zf - 1.0)
-    n111 = grad(int(permute(BB + 1)), xf - 1.0, yf - 1.0, zf - 1.0)
-    x1 = lerp(n000, n100, u)
-    x2 = lerp(n010, n110, u)
-    y1 = lerp(x1, x2, v)
-    x3 = lerp(n001, n101, u)
-    x4 = lerp(n011, n111, u)
-    y2 = lerp(x3, x4, v)
-    return (lerp(y1, y2, w) + 1) * 0.5
+def simplex_noise(x, y, z):
+    v = ti.Vector([x, y, z])
+    # Skew into the simplex grid and unskew back to the first corner
+    i = ti.floor(v + v.sum() / 3.0)
+    x0 = v - i + i.sum() / 6.0
+    # Rank the axes to find the middle two corners
+    g = ti.Vector(
+        [
+            ti.select(x0[0] >= x0[1], 1.0, 0.0),
+            ti.select(x0[1] >= x0[2], 1.0, 0.0),
+            ti.select(x0[2] >= x0[0], 1.0, 0.0),
+        ]
+    )
+    l = 1.0 - g
+    i1 = ti.min(g, ti.Vector([l[2], l[0], l[1]]))
+    i2 = ti.max(g, ti.Vector([l[2], l[0], l[1]]))
+    corners = [ti.Vector([0.0, 0.0, 0.0]), i1, i2, ti.Vector([1.0, 1.0, 1.0])]
+    ci = ti.cast(i, ti.i32) % 289
+    n = 0.0
+    for k in ti.static(range(4)):
+        o = ti.cast(corners[k], ti.i32)
+        d = x0 - corners[k] + k / 6.0
+        # The last permute and the hash-to-gradient map are one table lookup
+        h = permute(permute(ci[2] + o[2]) + ci[1] + o[1]) + ci[0] + o[0]
+        m = ti.max(0.5 - d.dot(d), 0.0)
+        n += m * m * m * m * grad_lut[h].dot(d)
+    return (105.0 * n + 1) * 0.5
 
 
 @ti.func
 def spread_fire(x: int, y: int, time: float):
     if y < FIRE_HEIGHT - 1:
-        offset = int(ti.random() * 3 + 1)
+        # One random byte drives the step: r % 3 picks the row offset,
+        # (r >> 2) % DECAY_MULT the decay and (r >> 5) % ADD_MULT the added heat.
+        # The last two share bits 5-7 but stay near uniform and uncorrelated
+        r = ti.cast(rand_field[x & (RAND_RES - 1), y & (RAND_RES - 1)], ti.i32)
+        offset = r % 3 + 1
         sample_y = ti.min(y + offset, FIRE_HEIGHT - 1)
-        below_intensity = firePixels[x, sample_y]
-        offset_noise = perlin_noise(x * 0.05 + time, y * 0.05 + time, time * 0.5)
+        offset_noise = simplex_noise(x * 0.05 + time, y * 0.05 + time, time * 0.5)
         rand_offset = int(offset_noise * 5.0) - 2
-        dst_x = ti.math.clamp(x + rand_offset, 0, FIRE_WIDTH - 1)
-        decay = int(ti.random() * DECAY_MULT) + 1
-        rand_intensity = int(ti.random() * ADD_MULT)
-        new_intensity = ti.max(0, below_intensity - decay + rand_intensity)
-        if fixedPixels[dst_x, y] == 0:
-            firePixels[dst_x, y] = new_intensity
+        # Gather from the pixel whose spark lands here, so writes never collide
+        src_x = ti.math.clamp(x - rand_offset, 0, FIRE_WIDTH - 1)
+        below_intensity = ti.cast(firePixels[src_x, sample_y], ti.i32)
+        decay = (r >> 2) % DECAY_MULT + 1
+        rand_intensity = (r >> 5) % ADD_MULT
+        new_intensity = ti.math.clamp(
+            below_intensity - decay + rand_intensity, 0, MAX_INTENSITY
+        )
+        next_intensity = firePixels[x, y]
+        if fixedPixels[x, y] == 0:
+            next_intensity = ti.cast(new_intensity, ti.u8)
+        firePixels_next[x, y] = next_intensity
+
+
+def do_fire(time):
+    rand_field.from_numpy(
+        _rng.integers(0, 256, size=(RAND_RES, RAND_RES), dtype=np.uint8)
+    )
+    _do_fire(time)
 
 
 @ti.kernel
-def do_fire(time: float):
+def _do_fire(time: float):
     for x, y in ti.ndrange(FIRE_WIDTH, FIRE_HEIGHT - 1):
         spread_fire(x, y, time)
+    # The bottom row is the fuel source and is never overwritten
+    for x, y in ti.ndrange(FIRE_WIDTH, FIRE_HEIGHT - 1):
+        firePixels[x, y] = firePixels_next[x, y]
 
 
 @ti.kernel
-def change_heat_at_position(mx: int, my: int, radius: int, multiplier: float):
-    for dx, dy in ti.ndrange((-radius, radius), (-radius, radius)):
-        x = mx + dx
-        y = my + dy
+def fill_brush_falloff(radius: int):
+    for d2 in range(radius * radius + 1):
+        brush_falloff[d2] = MAX_INTENSITY * (1 - ti.sqrt(d2) / radius)
+
+
+def load_brush_falloff(radius):
+    # The table only depends on the radius, so rebuild it when that changes
+    global _brush_falloff_radius
+    if radius != _brush_falloff_radius:
+        fill_brush_falloff(radius)
+        _brush_falloff_radius = radius
+
+
+@ti.func
+def add_heat(x, y, delta):
+    heat = ti.cast(firePixels[x, y], ti.i32) + delta
+    firePixels[x, y] = ti.cast(ti.math.clamp(heat, 0, MAX_INTENSITY), ti.u8)
+
+
+@ti.kernel
+def _change_heat_at_position(mx: int, my: int, radius: int, multiplier: float):
+    r2 = radius * radius
+    # Clip the brush to the domain so the loop needs no bounds check
+    for x, y in ti.ndrange(
+        (ti.max(mx - radius, 0), ti.min(mx + radius, FIRE_WIDTH)),
+        (ti.max(my - radius, 0), ti.min(my + radius, FIRE_HEIGHT)),
+    ):
+        dx = x - mx
+        dy = y - my
+        d2 = dx * dx + dy * dy
+        if d2 <= r2:
+            delta = int(brush_falloff[d2] * multiplier * ti.abs(multiplier))
+            add_heat(x, y, delta)
+
+
+def change_heat_at_position(mx, my, radius, multiplier):
+    load_brush_falloff(radius)
+    _change_heat_at_position(mx, my, radius, multiplier)
+
+
+@ti.kernel
+def _change_heat_along_points(
+    xs: ti.types.ndarray(),
+    ys: ti.types.ndarray(),
+    xmin: int,
+    xmax: int,
+    ymin: int,
+    ymax: int,
+    radius: int,
+    multiplier: float,
+):
+    # Stamp every point of the batch in a single launch. Deltas are summed
+    # atomically into heat_delta and applied once per pixel afterwards, which
+    # matches stamping the points one at a time with change_heat_at_position.
+    r2 = radius * radius
+    for i, dx, dy in ti.ndrange(xs.shape[0], (-radius, radius), (-radius, radius)):
+        x = xs[i] + dx
+        y = ys[i] + dy
         if 0 <= x < FIRE_WIDTH and 0 <= y < FIRE_HEIGHT:
-            dist = (dx * dx + dy * dy) ** 0.5
-            if dist <= radius:
-                delta = int(
-                    MAX_INTENSITY
-                    * (1 - dist / radius)
-                    * multiplier
-                    * multiplier
-                    * (ti.abs(multiplier) / multiplier)
-                )
-                firePixels[x, y] = ti.min(MAX_INTENSITY, firePixels[x, y] + delta)
+            d2 = dx * dx + dy * dy
+            if d2 <= r2:
+                delta = int(brush_falloff[d2] * multiplier * ti.abs(multiplier))
+                ti.atomic_add(heat_delta[x, y], delta)
+    for x, y in ti.ndrange(
+        (ti.max(xmin - radius, 0), ti.min(xmax + radius, FIRE_WIDTH)),
+        (ti.max(ymin - radius, 0), ti.min(ymax + radius, FIRE_HEIGHT)),
+    ):
+        if heat_delta[x, y] != 0:
+            add_heat(x, y, heat_delta[x, y])
+            heat_delta[x, y] = 0
+
+
+def change_heat_along_points(xs, ys, radius, multiplier):
+    load_brush_falloff(radius)
+    _change_heat_along_points(
+        xs, ys, xs.min(), xs.max(), ys.min(), ys.max(), radius, multiplier
+    )
 
 
 @ti.kernel
 def set_fixed_pixels(mx: int, my: int, radius: int, state: int):
-    for dx, dy in ti.ndrange((-radius, radius), (-radius, radius)):
-        x = mx + dx
-        y = my + dy
-        if 0 <= x < FIRE_WIDTH and 0 <= y < FIRE_HEIGHT:
-            dist = (dx * dx + dy * dy) ** 0.5
-            if dist <= radius:
-                fixedPixels[x, y] = state
+    r2 = radius * radius
+    # Same clipped disk walk as _change_heat_at_position
+    for x, y in ti.ndrange(
+        (ti.max(mx - radius, 0), ti.min(mx + radius, FIRE_WIDTH)),
+        (ti.max(my - radius, 0), ti.min(my + radius, FIRE_HEIGHT)),
+    ):
+        dx = x - mx
+        dy = y - my
+        if dx * dx + dy * dy <= r2:
+            fixedPixels[x, y] = ti.cast(state, ti.u8)
 
 
 @ti.kernel
 def set_fixed_pixels_rect(xmin: int, xmax: int, ymin: int, ymax: int, state: int):
+    # Bounds are clipped to the grid by the caller
     for x, y in ti.ndrange((xmin, xmax + 1), (ymin, ymax + 1)):
-        if 0 <= x < FIRE_WIDTH and 0 <= y < FIRE_HEIGHT:
-            fixedPixels[x, y] = state
+        fixedPixels[x, y] = ti.cast(state, ti.u8)
 
 
 @ti.kernel
-def update_image():
+def update_image(out: ti.types.ndarray()):
+    # Fill a caller-owned (height, width) RGB32 buffer in place, so frames need
+    # no new allocation; the overlays below then draw into the same buffer.
+    # Walking x outermost keeps the firePixels reads contiguous
     for x, y in ti.ndrange(FIRE_WIDTH, FIRE_HEIGHT):
-        intensity = ti.min(MAX_INTENSITY, ti.max(0, firePixels[x, y]))
-        for c in ti.static(range(3)):
-            image[x, FIRE_HEIGHT - 1 - y, c] = colors[intensity][c]
+        out[y, x] = colors[ti.cast(firePixels[x, y], ti.i32)]
 
 
 @ti.kernel
 def initialize_fire():
     for x in range(FIRE_WIDTH):
-        firePixels[x, FIRE_HEIGHT - 1] = MAX_INTENSITY
+        firePixels[x, FIRE_HEIGHT - 1] = ti.cast(MAX_INTENSITY, ti.u8)
 
 
 @ti.kernel
 def clear_fixed_pixels():
     for x, y in ti.ndrange(FIRE_WIDTH, FIRE_HEIGHT):
-        fixedPixels[x, y] = 0
+        fixedPixels[x, y] = ti.cast(0, ti.u8)
 
 
 @ti.kernel
-def highlight_fixed_pixels():
+def highlight_fixed_pixels(out: ti.types.ndarray()):
     for x, y in ti.ndrange(FIRE_WIDTH, FIRE_HEIGHT):
         if fixedPixels[x, y] == 1:
-            image[x, FIRE_HEIGHT - 1 - y, 0] = 0
-            image[x, FIRE_HEIGHT - 1 - y, 1] = 255
-            image[x, FIRE_HEIGHT - 1 - y, 2] = 255
+            out[y, x] = ti.u32(0xFF00FFFF)
+
+
+@ti.func
+def div255(x):
+    # x // 255 for each 16-bit lane of x, exact for lanes up to 255 * 255
+    return (x + 0x00010001 + ((x >> 8) & 0x00FF00FF)) >> 8
 
 
 @ti.kernel
-def render_tool_radius(mx: int, my: int, brush_radius: int, alpha: int):
+def render_tool_radius(
+    out: ti.types.ndarray(), mx: int, my: int, brush_radius: int, alpha: int
+):
     rad_squared = brush_radius * brush_radius
+    inv_alpha = ti.u32(255 - alpha)
+    grey = ti.u32(128 * alpha)
     for dx, dy in ti.ndrange(
         (-brush_radius, brush_radius + 1), (-brush_radius, brush_radius + 1)
     ):
@@ -195,14 +313,18 @@ def render_tool_radius(mx: int, my: int, brush_radius: int, alpha: int):
         if 0 <= x < FIRE_WIDTH and 0 <= y < FIRE_HEIGHT:
             sq_dist = dx * dx + dy * dy
             if sq_dist <= rad_squared:
-                for c in ti.static(range(3)):
-                    orig = image[x, y, c]
-                    grey = 128
-                    blended = (orig * (255 - alpha) + grey * alpha) // 255
-                    image[x, y, c] = blended
+                # Blend toward grey as (orig * (255 - alpha) + 128 * alpha) // 255,
+                # with red and blue sharing one word in 16-bit lanes
+                orig = out[y, x]
+                rb = (orig & 0x00FF00FF) * inv_alpha + grey * 0x00010001
+                g = ((orig >> 8) & 0xFF) * inv_alpha + grey
+                rgb = (div255(rb) & 0x00FF00FF) | ((div255(g) & 0xFF) << 8)
+                out[y, x] = rgb | ti.u32(0xFF000000)
 
 
 @ti.kernel
 def fire_rectangle(xmin: int, xmax: int, ymin: int, ymax: int, intensity: float):
+    # Bounds are clipped to the grid by the caller
     for x, y in ti.ndrange((xmin, xmax + 1), (ymin, ymax + 1)):
-        firePixels[x, y] = MAX_INTENSITY * intensity
+        heat = ti.math.clamp(MAX_INTENSITY * intensity, 0, MAX_INTENSITY)
+        firePixels[x, y] = ti.cast(heat, ti.u8)
@@ -9,9 +9,10 @@ from PySide6.QtWidgets import (QApplication, QButtonGroup, QComboBox,
                                QHBoxLayout, QLabel, QMainWindow, QPushButton,
                                QRadioButton, QSlider, QVBoxLayout, QWidget)
 
-from core import (FIRE_HEIGHT, FIRE_WIDTH, clear_fixed_pixels, do_fire,
-                  firePixels, get_palette_list, highlight_fixed_pixels, image,
-                  initialize_fire, render_tool_radius, update_image)
+from core import (FIRE_HEIGHT, FIRE_WIDTH, MAX_BRUSH_RADIUS,
+                  clear_fixed_pixels, do_fire, firePixels, get_palette_list,
+                  highlight_fixed_pixels, initialize_fire, render_tool_radius,
+                  update_image)
 from modes import (FireLineMode, FireMode, FireRectMode, FixMode, FixRectMode,
                    Mode, ModeType)
 from tools import (FireBrushTool, FireEraseTool, FireLineTool, FireRectTool,
@@ -24,21 +25,12 @@ class FireWindow(QMainWindow):
         super().__init__()
         self.current_time = 0
         self.brush_radius = 25
-        self.brush_changed = time.time() - 10
+        self.brush_changed = time.monotonic() - 10
         self.mx = 0.5
         self.my = 0.5
         self.pressing_lmb = False
         self.pressing_rmb = False
         self.intensity_percent = 100
-        self.modes: Dict[ModeType, Mode] = {
-            ModeType.FIRE: FireMode(),
-            ModeType.FIX: FixMode(),
-            ModeType.FIRE_LINE: FireLineMode(),
-            ModeType.FIRE_RECT: FireRectMode(),
-            ModeType.FIX_RECT: FixRectMode(),
-        }
-        self.mode = ModeType.FIRE  # Default mode
-
         self.tools: Dict[ToolType, Tool] = {
             ToolType.FIRE_BRUSH: FireBrushTool(),
             ToolType.FIRE_ERASE: FireEraseTool(),
@@ -49,8 +41,32 @@ class FireWindow(QMainWindow):
             ToolType.FIRE_RECT: FireRectTool(),
             ToolType.FIX_RECT: FixRectTool(),
         }
+        # Tools stamped into the fire each frame. The fixed-pixel highlight is
+        # left out, since update_frame draws it after the image is refreshed
+        self._frame_tools = [
+            tool
+            for tool_type, tool in self.tools.items()
+            if tool_type != ToolType.HIGHLIGHT_FIXED
+        ]
+        self.modes: Dict[ModeType, Mode] = {
+            ModeType.FIRE: FireMode(self.tools),
+            ModeType.FIX: FixMode(self.tools),
+            ModeType.FIRE_LINE: FireLineMode(self.tools),
+            ModeType.FIRE_RECT: FireRectMode(self.tools),
+            ModeType.FIX_RECT: FixRectMode(self.tools),
+        }
+        self.mode = ModeType.FIRE  # Default mode
+        # Keyboard shortcuts, looked up by key code
+        self._key_handlers = {
+            Qt.Key.Key_B: lambda: self.set_mode(ModeType.FIRE),
+            Qt.Key.Key_F: lambda: self.set_mode(ModeType.FIX),
+            Qt.Key.Key_V: self.toggle_highlight_fixed,
+            Qt.Key.Key_P: self.cycle_palette,
+            Qt.Key.Key_R: self.reset_fire,
+            Qt.Key.Key_S: self.show_brush_radius,
+        }
         # --- FPS Counter ---
-        self.last_fps_time = time.time()
+        self.last_fps_time = time.monotonic()
         self.frame_count = 0
         self.fps = 0
         # Use palette list from core.py
@@ -58,6 +74,15 @@ class FireWindow(QMainWindow):
         self.palette_idx = 0
         self.palettes[self.palette_idx][1]()
         self.setWindowTitle("Fire Effect (PySide6)")
+        # Frame buffer and the QImage viewing it are created once and reused
+        self.frame = np.empty((FIRE_HEIGHT, FIRE_WIDTH), dtype=np.uint32)
+        self.qimg = QImage(
+            self.frame.data,
+            FIRE_WIDTH,
+            FIRE_HEIGHT,
+            FIRE_WIDTH * 4,
+            QImage.Format.Format_RGB32,
+        )
         self.label = QLabel(self)
         central_widget = QWidget(self)
         self.setCentralWidget(central_widget)
@@ -72,6 +97,9 @@ class FireWindow(QMainWindow):
 
         self.resize(FIRE_WIDTH, FIRE_HEIGHT)
         initialize_fire()
+        # Step and present once up front, so the per-frame kernels are compiled
+        # during start-up rather than stalling the first timer tick
+        self.update_frame()
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_frame)
@@ -87,7 +115,7 @@ class FireWindow(QMainWindow):
 
     @imx.setter
     def imx(self, value):
-        self.mx = np.clip(value / FIRE_WIDTH, 0, 1)
+        self.mx = max(0.0, min(value / FIRE_WIDTH, 1.0))
 
     @property
     def imy(self):
@@ -95,7 +123,7 @@ class FireWindow(QMainWindow):
 
     @imy.setter
     def imy(self, value):
-        self.my = np.clip(value / FIRE_HEIGHT, 0, 1)
+        self.my = max(0.0, min(value / FIRE_HEIGHT, 1.0))
 
     def init_sidepanel(self):
         panel = QWidget()
@@ -227,7 +255,7 @@ class FireWindow(QMainWindow):
         if mode == self.mode:
             return
         # Deactivate previous mode
-        self.modes[self.mode].deactivate(self.tools)
+        self.modes[self.mode].deactivate()
         # Clear FireLineTool or FireRectTool state if leaving those modes
         if self.mode == ModeType.FIRE_LINE:
             s = self.tools[ToolType.FIRE_LINE]
@@ -243,16 +271,15 @@ class FireWindow(QMainWindow):
             s.clear_first_point()
         self.mode = mode
         # Activate new mode
-        self.modes[self.mode].activate(self.tools)
+        mode = self.modes[self.mode]
+        mode.activate()
         # Activate tool depending on mouse buttons
-        lmb_tool = self.modes[self.mode].lmb_tool_type
-        rmb_tool = self.modes[self.mode].rmb_tool_type
         if self.pressing_lmb:
-            self.tools[lmb_tool].trigger_on()
-            self.tools[rmb_tool].trigger_off()
+            mode.lmb_tool.trigger_on()
+            mode.rmb_tool.trigger_off()
         elif self.pressing_rmb:
-            self.tools[rmb_tool].trigger_on()
-            self.tools[lmb_tool].trigger_off()
+            mode.rmb_tool.trigger_on()
+            mode.lmb_tool.trigger_off()
         self.brush_changed = 0
         self.update_tool_buttons()
 
@@ -270,6 +297,21 @@ class FireWindow(QMainWindow):
             tool.trigger_on()
         self.update_tool_buttons()
 
+    def cycle_palette(self):
+        self.palette_idx = (self.palette_idx + 1) % len(self.palettes)
+        self.palettes[self.palette_idx][1]()
+        if hasattr(self, "palette_combo"):
+            self.palette_combo.setCurrentIndex(self.palette_idx)
+        print(self.palettes[self.palette_idx][0])
+
+    def reset_fire(self):
+        firePixels.fill(0)
+        initialize_fire()
+        clear_fixed_pixels()
+
+    def show_brush_radius(self):
+        self.brush_changed = time.monotonic() + 3
+
     def update_tool_buttons(self):
         # Update radio buttons
         self.fire_radio.setChecked(self.mode == ModeType.FIRE)
@@ -291,46 +333,37 @@ class FireWindow(QMainWindow):
     def update_frame(self):
         self.current_time += 0.05
         do_fire(self.current_time)
+        # The cursor is read once and shared by the tools and the brush outline
         mx_int = self.imx
         my_int = self.imy
-        intensity = float(self.intensity_percent / 100)
-
-        for _, tool in self.tools.items():
-            if tool.is_active():
-                params = {
-                    "mx_int": mx_int,
-                    "my_int": my_int,
-                    "brush_radius": self.brush_radius,
-                    "intensity": intensity,
-                }
-                tool_args = [params[name] for name in tool.param_names]
-                tool.apply(*tool_args)
-        update_image()
+        # Same for every tool this frame, so build it once outside the loop
+        params = {
+            "mx_int": mx_int,
+            "my_int": my_int,
+            "brush_radius": self.brush_radius,
+            "intensity": float(self.intensity_percent / 100),
+        }
+        for tool in self._frame_tools:
+            if tool.active:
+                tool.apply(*[params[name] for name in tool.param_names])
+        # Nothing is visible while minimized, so only advance the simulation
+        if self.isMinimized():
+            return
+        update_image(self.frame)
         # Show highlight if highlight_fixed is active or if fix mode is active
         if self.tools[ToolType.HIGHLIGHT_FIXED].is_active():
-            highlight_fixed_pixels()
+            highlight_fixed_pixels(self.frame)
+        # One clock read serves both the brush fade and the FPS counter
+        now = time.monotonic()
         # Fade alpha from 80 to 0 over 2 seconds
-        elapsed = time.time() - self.brush_changed
+        elapsed = now - self.brush_changed
         if elapsed < 2:
             alpha = int(80 * min(1, (1 - elapsed / 2)))
-            render_tool_radius(
-                self.imx,
-                int((1 - self.my) * FIRE_HEIGHT),
-                self.brush_radius,
-                alpha,
-            )
-        np_img = image.to_numpy()
-        # This copy is annoying, as it likely introduces a lot of unneeded copies, but this needs to be an actual array and not a view for .data
-        np_img = np.rot90(np_img).copy()
-        h, w, ch = np_img.shape
-
-        bytes_per_line = ch * w
-        qimg = QImage(np_img.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-        self.label.setPixmap(QPixmap.fromImage(qimg))
+            render_tool_radius(self.frame, mx_int, my_int, self.brush_radius, alpha)
+        self.label.setPixmap(QPixmap.fromImage(self.qimg))
 
         # --- FPS Counter update ---
         self.frame_count += 1
-        now = time.time()
         elapsed_fps = now - self.last_fps_time
         if elapsed_fps >= 0.25:
             self.fps = int(self.frame_count / elapsed_fps)
@@ -340,8 +373,8 @@ class FireWindow(QMainWindow):
 
     def mousePressEvent(self, event: QMouseEvent):
         self.update_mouse_position(event)
-        lmb_tool = self.modes[self.mode].lmb_tool_type
-        rmb_tool = self.modes[self.mode].rmb_tool_type
+        lmb_tool = self.modes[self.mode].lmb_tool
+        rmb_tool = self.modes[self.mode].rmb_tool
         mx_int = self.imx
         my_int = self.imy
         intensity: float = float(self.intensity_percent / 100)
@@ -404,32 +437,25 @@ class FireWindow(QMainWindow):
                     self.pressing_rmb = False
             self.update_tool_buttons()
             return
+        # Each tool takes the subset of these that its param_names lists
+        params = {
+            "mx_int": mx_int,
+            "my_int": my_int,
+            "brush_radius": self.brush_radius,
+            "intensity": intensity,
+        }
         if event.button() == Qt.MouseButton.LeftButton:
-            self.tools[lmb_tool].trigger_on()
-            self.tools[rmb_tool].trigger_off()
+            lmb_tool.trigger_on()
+            rmb_tool.trigger_off()
             self.brush_changed = 0
             self.pressing_lmb = True
-            # FIXME: This certainly is one way to do this, but it seems very hacky
-            # Pass intensity to tool if it supports it
-            if hasattr(self.tools[lmb_tool], "apply"):
-                try:
-                    self.tools[lmb_tool].apply(
-                        mx_int, my_int, self.brush_radius, intensity
-                    )
-                except TypeError:
-                    self.tools[lmb_tool].apply(mx_int, my_int, self.brush_radius)
+            lmb_tool.apply(*[params[name] for name in lmb_tool.param_names])
         elif event.button() == Qt.MouseButton.RightButton:
-            self.tools[rmb_tool].trigger_on()
-            self.tools[lmb_tool].trigger_off()
+            rmb_tool.trigger_on()
+            lmb_tool.trigger_off()
             self.brush_changed = 0
             self.pressing_rmb = True
-            if hasattr(self.tools[rmb_tool], "apply"):
-                try:
-                    self.tools[rmb_tool].apply(
-                        mx_int, my_int, self.brush_radius, intensity
-                    )
-                except TypeError:
-                    self.tools[rmb_tool].apply(mx_int, my_int, self.brush_radius)
+            rmb_tool.apply(*[params[name] for name in rmb_tool.param_names])
         self.update_tool_buttons()
 
     def mouseReleaseEvent(self, event: QMouseEvent):
@@ -441,13 +467,12 @@ class FireWindow(QMainWindow):
                 self.pressing_rmb = False
             self.update_tool_buttons()
             return
-        lmb_tool = self.modes[self.mode].lmb_tool_type
-        rmb_tool = self.modes[self.mode].rmb_tool_type
+        mode = self.modes[self.mode]
         if event.button() == Qt.MouseButton.LeftButton:
-            self.tools[lmb_tool].trigger_off()
+            mode.lmb_tool.trigger_off()
             self.pressing_lmb = False
         elif event.button() == Qt.MouseButton.RightButton:
-            self.tools[rmb_tool].trigger_off()
+            mode.rmb_tool.trigger_off()
             self.pressing_rmb = False
         self.update_tool_buttons()
 
@@ -462,7 +487,7 @@ class FireWindow(QMainWindow):
 
     def wheelEvent(self, event: QWheelEvent):
         self.update_mouse_position(event)
-        now = time.time()
+        now = time.monotonic()
         delta_y = event.angleDelta().y()
         if now - self.brush_changed < 0.5:
             accel = 1 / (now - self.brush_changed + 0.25)
@@ -470,29 +495,13 @@ class FireWindow(QMainWindow):
             accel = 1
         delta_with_accel = int(delta_y * accel / 32)
         self.brush_radius += delta_with_accel
-        self.brush_radius = max(1, min(self.brush_radius, 400))
+        self.brush_radius = max(1, min(self.brush_radius, MAX_BRUSH_RADIUS))
         self.brush_changed = now
 
     def keyPressEvent(self, event: QKeyEvent):
-        key = event.key()
-        if key == Qt.Key.Key_B:
-            self.set_mode(ModeType.FIRE)
-        elif key == Qt.Key.Key_F:
-            self.set_mode(ModeType.FIX)
-        elif key == Qt.Key.Key_V:
-            self.toggle_highlight_fixed()
-        elif key == Qt.Key.Key_P:
-            self.palette_idx = (self.palette_idx + 1) % len(self.palettes)
-            self.palettes[self.palette_idx][1]()
-            if hasattr(self, "palette_combo"):
-                self.palette_combo.setCurrentIndex(self.palette_idx)
-            print(self.palettes[self.palette_idx][0])
-        elif key == Qt.Key.Key_R:
-            firePixels.fill(0)
-            initialize_fire()
-            clear_fixed_pixels()
-        elif key == Qt.Key.Key_S:
-            self.brush_changed = time.time() + 3
+        handler = self._key_handlers.get(event.key())
+        if handler is not None:
+            handler()
         self.update_tool_buttons()
 
 
@@ -12,67 +12,65 @@ class ModeType(Enum):
 
 
 class Mode:
-    def __init__(self, lmb_tool_type, rmb_tool_type):
+    def __init__(self, tools, lmb_tool_type, rmb_tool_type):
+        self.tools = tools
         self.lmb_tool_type = lmb_tool_type
         self.rmb_tool_type = rmb_tool_type
+        self.lmb_tool = tools[lmb_tool_type]
+        self.rmb_tool = tools[rmb_tool_type]
+        # Switching modes turns off every tool except highlight
+        self._trigger_offs = tuple(
+            tool.trigger_off
+            for ttype, tool in tools.items()
+            if ttype != ToolType.HIGHLIGHT_FIXED
+        )
 
-    def activate(self, tools):
-        # Deactivate all tools except highlight
-        for ttype, tool in tools.items():
-            if ttype != ToolType.HIGHLIGHT_FIXED:
-                tool.trigger_off()
-        return tools
+    def activate(self):
+        for trigger_off in self._trigger_offs:
+            trigger_off()
 
-    def deactivate(self, tools):
-        # Deactivate all tools except highlight
-        for ttype, tool in tools.items():
-            if ttype != ToolType.HIGHLIGHT_FIXED:
-                tool.trigger_off()
-        return tools
+    def deactivate(self):
+        for trigger_off in self._trigger_offs:
+            trigger_off()
 
 
 class FireMode(Mode):
-    def __init__(self):
-        super().__init__(ToolType.FIRE_BRUSH, ToolType.FIRE_ERASE)
+    def __init__(self, tools):
+        super().__init__(tools, ToolType.FIRE_BRUSH, ToolType.FIRE_ERASE)
 
 
 class HighlightFixedMixin(Mode):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._highlight_tool = self.tools[ToolType.HIGHLIGHT_FIXED]
         self._highlight_fixed_prev_state = None
 
-    def activate(self, tools):
-        highlight_tool = tools.get(ToolType.HIGHLIGHT_FIXED)
-        if highlight_tool:
-            self._highlight_fixed_prev_state = highlight_tool.is_active()
-            highlight_tool.trigger_on()
-        super().activate(tools)
-        return tools
+    def activate(self):
+        self._highlight_fixed_prev_state = self._highlight_tool.is_active()
+        self._highlight_tool.trigger_on()
+        super().activate()
 
-    def deactivate(self, tools):
-        highlight_tool = tools.get(ToolType.HIGHLIGHT_FIXED)
-        if highlight_tool and self._highlight_fixed_prev_state is not None:
-            if not self._highlight_fixed_prev_state:
-                highlight_tool.trigger_off()
-        super().deactivate(tools)
-        return tools
+    def deactivate(self):
+        if self._highlight_fixed_prev_state is False:
+            self._highlight_tool.trigger_off()
+        super().deactivate()
 
 
 class FixMode(HighlightFixedMixin, Mode):
-    def __init__(self):
-        super().__init__(ToolType.FIX_BRUSH, ToolType.FIX_ERASE)
+    def __init__(self, tools):
+        super().__init__(tools, ToolType.FIX_BRUSH, ToolType.FIX_ERASE)
 
 
 class FixRectMode(HighlightFixedMixin, Mode):
-    def __init__(self):
-        super().__init__(ToolType.FIX_RECT, ToolType.FIX_RECT)
+    def __init__(self, tools):
+        super().__init__(tools, ToolType.FIX_RECT, ToolType.FIX_RECT)
 
 
 class FireLineMode(Mode):
-    def __init__(self):
-        super().__init__(ToolType.FIRE_LINE, ToolType.FIRE_LINE)
+    def __init__(self, tools):
+        super().__init__(tools, ToolType.FIRE_LINE, ToolType.FIRE_LINE)
 
 
 class FireRectMode(Mode):
-    def __init__(self):
-        super().__init__(ToolType.FIRE_RECT, ToolType.FIRE_RECT)
+    def __init__(self, tools):
+        super().__init__(tools, ToolType.FIRE_RECT, ToolType.FIRE_RECT)
@@ -1,11 +1,41 @@
 from enum import Enum, auto
+from functools import lru_cache
 from typing import Optional
 
-from core import (change_heat_at_position, fire_rectangle,
-                  highlight_fixed_pixels, set_fixed_pixels,
+import numpy as np
+
+from constants import FIRE_HEIGHT, FIRE_WIDTH
+from core import (change_heat_along_points, change_heat_at_position,
+                  fire_rectangle, highlight_fixed_pixels, set_fixed_pixels,
                   set_fixed_pixels_rect)
 
 
+def clip_rect(xmin, xmax, ymin, ymax):
+    # Clip an inclusive rectangle to the grid, so kernels can skip bounds checks
+    return (
+        max(0, xmin),
+        min(FIRE_WIDTH - 1, xmax),
+        max(0, ymin),
+        min(FIRE_HEIGHT - 1, ymax),
+    )
+
+
+@lru_cache(maxsize=64)
+def line_steps(n):
+    # Fractions along a line of n samples, shared by every line of that length
+    steps = np.arange(n) / max(n - 1, 1)
+    steps.flags.writeable = False
+    return steps
+
+
+def line_points(x0, y0, x1, y1):
+    # One sample per pixel along the major axis, as int32 arrays for the kernels
+    steps = line_steps(max(abs(x1 - x0), abs(y1 - y0)) + 1)
+    xs = x0 + np.round((x1 - x0) * steps).astype(np.int32)
+    ys = y0 + np.round((y1 - y0) * steps).astype(np.int32)
+    return xs, ys
+
+
 class ToolType(Enum):
     FIRE_BRUSH = auto()
     FIRE_ERASE = auto()
@@ -83,8 +113,8 @@ class FixEraseTool(Tool):
 class HighlightFixedTool(Tool):
     tool_type = ToolType.HIGHLIGHT_FIXED
 
-    def apply(self):
-        highlight_fixed_pixels()
+    def apply(self, out):
+        highlight_fixed_pixels(out)
 
 
 class FireLineTool(Tool):
@@ -105,39 +135,9 @@ class FireLineTool(Tool):
         # Only draw if first_point is set and this is the second click
         if self.first_point is not None:
             x0, y0 = self.first_point
-            x1, y1 = mx_int, my_int
-
-            # Bresenham's line algorithm
-            # https://en.wikipedia.org/wiki/Bresenham's_line_algorithm
-            dx = abs(x1 - x0)
-            dy = abs(y1 - y0)
-            x, y = x0, y0
-            sx = 1 if x0 < x1 else -1
-            sy = 1 if y0 < y1 else -1
-            if dx > dy:
-                err = dx // 2
-                while x != x1:
-                    change_heat_at_position(
-                        x, y, radius=brush_radius, multiplier=intensity
-                    )
-                    err -= dy
-                    if err < 0:
-                        y += sy
-                        err += dx
-                    x += sx
-                change_heat_at_position(x, y, radius=brush_radius, multiplier=intensity)
-            else:
-                err = dy // 2
-                while y != y1:
-                    change_heat_at_position(
-                        x, y, radius=brush_radius, multiplier=intensity
-                    )
-                    err -= dx
-                    if err < 0:
-                        x += sx
-                        err += dy
-                    y += sy
-                change_heat_at_position(x, y, radius=brush_radius, multiplier=intensity)
+            # Stamp every point of the line in a single kernel launch
+            xs, ys = line_points(x0, y0, mx_int, my_int)
+            change_heat_along_points(xs, ys, radius=brush_radius, multiplier=intensity)
             self.clear_first_point()
 
 
@@ -160,8 +160,9 @@ class FireRectTool(Tool):
         if self.first_point is not None:
             x0, y0 = self.first_point
             x1, y1 = mx_int, my_int
-            xmin, xmax = sorted([x0, x1])
-            ymin, ymax = sorted([y0, y1])
+            xmin, xmax = min(x0, x1), max(x0, x1)
+            ymin, ymax = min(y0, y1), max(y0, y1)
+            xmin, xmax, ymin, ymax = clip_rect(xmin, xmax, ymin, ymax)
             # Draw the rectangle with intensity percent
             fire_rectangle(xmin, xmax, ymin, ymax, intensity)
             self.clear_first_point()
@@ -189,8 +190,9 @@ class FixRectTool(Tool):
         if self.first_point is not None:
             x0, y0 = self.first_point
             x1, y1 = mx_int, my_int
-            xmin, xmax = sorted([x0, x1])
-            ymin, ymax = sorted([y0, y1])
+            xmin, xmax = min(x0, x1), max(x0, x1)
+            ymin, ymax = min(y0, y1), max(y0, y1)
+            xmin, xmax, ymin, ymax = clip_rect(xmin, xmax, ymin, ymax)
             # Set or clear fixed pixels in the rectangle
 
             set_fixed_pixels_rect(
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 
 import numpy as np
 import taichi as ti
@@ -10,12 +11,67 @@ from palettes import (palette_cold_fire, palette_cyber, palette_electric,
                       palette_toxic)
 from ti_renderer.scene import Scene
 
-ti.init(arch=ti.gpu)
+# Tiled simplex noise volume, baked once and sampled by spread_fire
+NOISE_RES = 64
+# Lattice units per tile; a multiple of 3 so the skewed simplex lattice tiles too
+NOISE_PERIOD = 6
+NOISE_TEXELS_PER_UNIT = NOISE_RES / NOISE_PERIOD
+# Random bytes for spread_fire, refreshed from the host every step
+RAND_RES = 64
+# Each RAND_RES block of the volume reads the tile at its own per-step offset,
+# so the bytes do not repeat on a fixed 64-voxel grid
+RAND_BLOCKS = tuple(
+    (n + RAND_RES - 1) // RAND_RES for n in (FIRE_WIDTH, FIRE_HEIGHT, FIRE_DEPTH)
+)
+_rng = np.random.default_rng()
+
+# Taichi state is created by init_3d() so importing this module stays cheap
+firePixels = None
+firePixels_next = None
+colors = None
+perm_lut = None
+grad_lut = None
+noise_vol = None
+rand_field = None
+rand_offsets = None
+scene = None
+_initialized = False
+# Whether the renderer's voxels already match firePixels and the palette
+_voxels_baked = False
+
+
+def init_3d(arch=ti.gpu):
+    global firePixels, firePixels_next, colors, perm_lut, grad_lut, noise_vol
+    global rand_field, rand_offsets
+    global scene
+    global _initialized
+    if _initialized:
+        return
+    ti.init(arch=arch)
+
+    # 3D Fire simulation field: (width, height, depth)
+    # Intensities never leave [0, MAX_INTENSITY], so a byte per voxel is enough
+    firePixels = ti.field(dtype=ti.u8, shape=(FIRE_WIDTH, FIRE_HEIGHT, FIRE_DEPTH))
+    # Next simulation step, so do_fire never reads voxels it has already updated.
+    # do_fire swaps the two buffers after every step instead of copying back.
+    firePixels_next = ti.field(dtype=ti.u8, shape=(FIRE_WIDTH, FIRE_HEIGHT, FIRE_DEPTH))
+    # Color palette, packed as 0x00BBGGRR so a lookup is a single 32-bit load
+    colors = ti.field(dtype=ti.u32, shape=(MAX_INTENSITY + 1))
+    # Simplex corner hash ((34x + 1)x) mod 289, baked for every index it is called with
+    perm_lut = ti.field(dtype=ti.i32, shape=(2 * 289))
+    perm_lut.from_numpy(permute_table())
+    # Simplex gradient of perm_lut[x] for each x, so the last hash needs no permute
+    grad_lut = ti.Vector.field(3, dtype=ti.f32, shape=(2 * 289))
+    grad_lut.from_numpy(gradient_table())
+    noise_vol = ti.field(dtype=ti.f32, shape=(NOISE_RES, NOISE_RES, NOISE_RES))
+    populate_noise(0.0)
+    rand_field = ti.field(dtype=ti.u8, shape=(RAND_RES, RAND_RES, RAND_RES))
+    rand_offsets = ti.Vector.field(3, dtype=ti.i32, shape=RAND_BLOCKS)
+
+    scene = Scene(exposure=1, voxel_edges=0)
+    scene.set_background_color((0, 0, 0))
+    _initialized = True
 
-# 3D Fire simulation field: (width, height, depth)
-firePixels = ti.field(dtype=ti.i32, shape=(FIRE_WIDTH, FIRE_HEIGHT, FIRE_DEPTH))
-# Color palette
-colors = ti.Vector.field(3, dtype=ti.u8, shape=(MAX_INTENSITY + 1))
 
 # --- Palette management ---
 
@@ -34,104 +90,199 @@ def get_palette_list():
     return _PALETTE_LIST
 
 
+@lru_cache(maxsize=None)
+def palette_array(palette_func):
+    # astype wraps out-of-range entries the same way per-element stores did
+    return np.asarray(palette_func()).astype(np.uint8)
+
+
 def set_palette(palette_func):
-    palette = palette_func()
-    for i in range(MAX_INTENSITY + 1):
-        colors[i] = ti.Vector([int(x) for x in palette[i]])  # Ensure vector of ints
+    global _voxels_baked
+    _voxels_baked = False
+    palette = palette_array(palette_func).astype(np.uint32)
+    colors.from_numpy(palette[:, 0] | palette[:, 1] << 8 | palette[:, 2] << 16)
+
+
+# --- 3D simplex noise and fire spread ---
+def permute_table():
+    x = np.arange(2 * 289)
+    return ((34 * x + 1) * x % 289).astype(np.int32)
+
+
+def gradient_table():
+    # Map each hash onto a 7x7 grid folded over an octahedron, then normalize
+    p = permute_table()
+    a = p % 49 // 7
+    b = p % 7
+    gx = a * (2.0 / 7.0) + (0.5 / 7.0 - 1.0)
+    gy = b * (2.0 / 7.0) + (0.5 / 7.0 - 1.0)
+    gz = 1.0 - np.abs(gx) - np.abs(gy)
+    # Integer form of gz <= 0 so exact ties fold the same way every time
+    fold = np.abs(4 * a - 13) + np.abs(4 * b - 13) >= 14
+    gx = np.where(fold, gx - (np.floor(gx) * 2.0 + 1.0), gx)
+    gy = np.where(fold, gy - (np.floor(gy) * 2.0 + 1.0), gy)
+    grad = np.stack([gx, gy, gz], axis=1)
+    grad *= 1.79284291400159 - 0.85373472095314 * (grad * grad).sum(axis=1)[:, None]
+    return grad.astype(np.float32)
 
 
-# --- 3D Perlin noise and fire spread ---
 @ti.func
 def lerp(a, b, t):
     return a * (1 - t) + b * t
 
 
 @ti.func
-def fade(t):
-    return t * t * t * (t * (t * 6 - 15) + 10)
+def permute(x):
+    return perm_lut[x]
 
 
 @ti.func
-def grad(hash, x, y, z):
-    h = hash & 15
-    u = x if h < 8 else y
-    v = y if h < 4 else (x if (h == 12 or h == 14) else z)
-    return (u if (h & 1) == 0 else -u) + (v if (h & 2) == 0 else -v)
+def simplex_noise(x, y, z):
+    v = ti.Vector([x, y, z])
+    # Skew into the simplex grid and unskew back to the first corner
+    i = ti.floor(v + v.sum() / 3.0)
+    x0 = v - i + i.sum() / 6.0
+    # Rank the axes to find the middle two corners
+    g = ti.Vector(
+        [
+            ti.select(x0[0] >= x0[1], 1.0, 0.0),
+            ti.select(x0[1] >= x0[2], 1.0, 0.0),
+            ti.select(x0[2] >= x0[0], 1.0, 0.0),
+        ]
+    )
+    l = 1.0 - g
+    i1 = ti.min(g, ti.Vector([l[2], l[0], l[1]]))
+    i2 = ti.max(g, ti.Vector([l[2], l[0], l[1]]))
+    corners = [ti.Vector([0.0, 0.0, 0.0]), i1, i2, ti.Vector([1.0, 1.0, 1.0])]
+    ci = ti.cast(i, ti.i32)
+    n = 0.0
+    for k in ti.static(range(4)):
+        c = ci + ti.cast(corners[k], ti.i32)
+        d = x0 - corners[k] + k / 6.0
+        # Wrap the corner by its unskewed position so the noise tiles every
+        # NOISE_PERIOD units on each axis
+        t = (6 * c - c.sum()) // (6 * NOISE_PERIOD)
+        c -= NOISE_PERIOD * t + NOISE_PERIOD // 3 * t.sum()
+        # The last permute and the hash-to-gradient map are one table lookup
+        h = permute(permute(c[2]) + c[1]) + c[0]
+        m = ti.max(0.5 - d.dot(d), 0.0)
+        n += m * m * m * m * grad_lut[h].dot(d)
+    return (105.0 * n + 1) * 0.5
 
 
-@ti.func
-def permute(x):
-    return ((34 * x + 1) * x) % 289
+@ti.kernel
+def populate_noise(seed: float):
+    for i, j, k in noise_vol:
+        noise_vol[i, j, k] = simplex_noise(
+            i / NOISE_TEXELS_PER_UNIT + seed,
+            j / NOISE_TEXELS_PER_UNIT + seed,
+            k / NOISE_TEXELS_PER_UNIT + seed,
+        )
 
 
 @ti.func
-def perlin_noise(x, y, z):
-    X = int(ti.floor(x)) & 255
-    Y = int(ti.floor(y)) & 255
-    Z = int(ti.floor(z)) & 255
-    xf = x - ti.floor(x)
-    yf = y - ti.floor(y)
-    zf = z - ti.floor(z)
-    u = fade(xf)
-    v = fade(yf)
-    w = fade(zf)
-    A = permute(X) + Y
-    AA = permute(A) + Z
-    AB = permute(A + 1) + Z
-    B = permute(X + 1) + Y
-    BA = permute(B) + Z
-    BB = permute(B + 1) + Z
-    n000 = grad(int(permute(AA)), xf, yf, zf)
-    n100 = grad(int(permute(BA)), xf - 1.0, yf, zf)
-    n010 = grad(int(permute(AB)), xf, yf - 1.0, zf)
-    n110 = grad(int(permute(BB)), xf - 1.0, yf - 1.0, zf)
-    n001 = grad(int(permute(AA + 1)), xf, yf, zf - 1.0)
-    n101 = grad(int(permute(BA + 1)), xf - 1.0, yf, zf - 1.0)
-    n011 = grad(int(permute(AB + 1)), xf, yf - 1.0, zf - 1.0)
-    n111 = grad(int(permute(BB + 1)), xf - 1.0, yf - 1.0, zf - 1.0)
-    x1 = lerp(n000, n100, u)
-    x2 = lerp(n010, n110, u)
-    y1 = lerp(x1, x2, v)
-    x3 = lerp(n001, n101, u)
-    x4 = lerp(n011, n111, u)
-    y2 = lerp(x3, x4, v)
-    return (lerp(y1, y2, w) + 1) * 0.5
+def sample_noise(x, y, z):
+    # Trilinear sample of noise_vol, with coordinates in noise lattice units
+    u = x * NOISE_TEXELS_PER_UNIT
+    v = y * NOISE_TEXELS_PER_UNIT
+    w = z * NOISE_TEXELS_PER_UNIT
+    x0 = int(ti.floor(u)) & (NOISE_RES - 1)
+    y0 = int(ti.floor(v)) & (NOISE_RES - 1)
+    z0 = int(ti.floor(w)) & (NOISE_RES - 1)
+    x1 = (x0 + 1) & (NOISE_RES - 1)
+    y1 = (y0 + 1) & (NOISE_RES - 1)
+    z1 = (z0 + 1) & (NOISE_RES - 1)
+    fx = u - ti.floor(u)
+    fy = v - ti.floor(v)
+    fz = w - ti.floor(w)
+    c00 = lerp(noise_vol[x0, y0, z0], noise_vol[x1, y0, z0], fx)
+    c10 = lerp(noise_vol[x0, y1, z0], noise_vol[x1, y1, z0], fx)
+    c01 = lerp(noise_vol[x0, y0, z1], noise_vol[x1, y0, z1], fx)
+    c11 = lerp(noise_vol[x0, y1, z1], noise_vol[x1, y1, z1], fx)
+    return lerp(lerp(c00, c10, fy), lerp(c01, c11, fy), fz)
 
 
 @ti.func
-def spread_fire(x: int, y: int, z: int, time: float):
-    if y < FIRE_HEIGHT - 1:
-        offset = int(ti.random() * 3 + 1)
-        sample_y = ti.min(y + offset, FIRE_HEIGHT - 1)
-        below_intensity = firePixels[x, sample_y, z]
-        offset_noise = perlin_noise(x * 0.05 + time, y * 0.05 + time, z * 0.05 + time)
-        rand_offset_x = int(offset_noise * 5.0) - 2
-        rand_offset_z = (
-            int(perlin_noise(z * 0.05 + time, x * 0.05 + time, y * 0.05 + time) * 5.0)
-            - 2
-        )
-        dst_x = ti.math.clamp(x + rand_offset_x, 0, FIRE_WIDTH - 1)
-        dst_z = ti.math.clamp(z + rand_offset_z, 0, FIRE_DEPTH - 1)
-        decay = int(ti.random() * DECAY_MULT) + 1
-        rand_intensity = int(ti.random() * ADD_MULT)
-        new_intensity = ti.max(0, below_intensity - decay + rand_intensity)
-        firePixels[dst_x, y, dst_z] = new_intensity
+def spread_fire(
+    src: ti.template(), dst: ti.template(), x: int, y: int, z: int, time: float
+):
+    # Gather: pull heat from the voxel that drifts onto (x, y, z)
+    # One random byte drives the step: r % 3 picks the row offset,
+    # (r >> 2) % DECAY_MULT the decay and (r >> 5) % ADD_MULT the added heat.
+    # The last two share bits 5-7 but stay near uniform and uncorrelated
+    o = rand_offsets[x // RAND_RES, y // RAND_RES, z // RAND_RES]
+    r = ti.cast(
+        rand_field[
+            (x + o[0]) & (RAND_RES - 1),
+            (y + o[1]) & (RAND_RES - 1),
+            (z + o[2]) & (RAND_RES - 1),
+        ],
+        ti.i32,
+    )
+    offset = r % 3 + 1
+    sample_y = ti.min(y + offset, FIRE_HEIGHT - 1)
+    offset_noise = sample_noise(x * 0.05 + time, y * 0.05 + time, z * 0.05 + time)
+    rand_offset_x = int(offset_noise * 5.0) - 2
+    rand_offset_z = (
+        int(sample_noise(z * 0.05 + time, x * 0.05 + time, y * 0.05 + time) * 5.0) - 2
+    )
+    src_x = ti.math.clamp(x - rand_offset_x, 0, FIRE_WIDTH - 1)
+    src_z = ti.math.clamp(z - rand_offset_z, 0, FIRE_DEPTH - 1)
+    below_intensity = ti.cast(src[src_x, sample_y, src_z], ti.i32)
+    decay = (r >> 2) % DECAY_MULT + 1
+    rand_intensity = (r >> 5) % ADD_MULT
+    new_intensity = ti.math.clamp(
+        below_intensity - decay + rand_intensity, 0, MAX_INTENSITY
+    )
+    dst[x, y, z] = ti.cast(new_intensity, ti.u8)
+
+
+def do_fire(time, bake=False):
+    # With bake set, the step also writes the renderer's voxels as it goes,
+    # so the next render_scene can skip its own pass over firePixels
+    global firePixels, firePixels_next, _voxels_baked
+    rand_field.from_numpy(
+        _rng.integers(0, 256, size=(RAND_RES, RAND_RES, RAND_RES), dtype=np.uint8)
+    )
+    rand_offsets.from_numpy(
+        _rng.integers(0, RAND_RES, size=(*RAND_BLOCKS, 3), dtype=np.int32)
+    )
+    _do_fire(firePixels, firePixels_next, time, bake)
+    firePixels, firePixels_next = firePixels_next, firePixels
+    _voxels_baked = bake
 
 
 @ti.kernel
-def do_fire(time: float):
+def _do_fire(src: ti.template(), dst: ti.template(), time: float, bake: ti.template()):
     for x, y, z in ti.ndrange(FIRE_WIDTH, FIRE_HEIGHT - 1, FIRE_DEPTH):
-        spread_fire(x, y, z, time)
+        spread_fire(src, dst, x, y, z, time)
+        if ti.static(bake):
+            scene.renderer.bake_fire_voxel(x, y, z, dst[x, y, z], colors)
+    # The bottom row is the fuel source and carries over unchanged
+    for x, z in ti.ndrange(FIRE_WIDTH, FIRE_DEPTH):
+        dst[x, FIRE_HEIGHT - 1, z] = src[x, FIRE_HEIGHT - 1, z]
+        if ti.static(bake):
+            scene.renderer.bake_fire_voxel(
+                x, FIRE_HEIGHT - 1, z, dst[x, FIRE_HEIGHT - 1, z], colors
+            )
+
+
+def clear_fire():
+    global _voxels_baked
+    firePixels.fill(0)
+    _voxels_baked = False
 
 
-@ti.kernel
 def initialize_fire():
-    for x, z in ti.ndrange(FIRE_WIDTH, FIRE_DEPTH):
-        firePixels[x, FIRE_HEIGHT - 1, z] = MAX_INTENSITY
+    global _voxels_baked
+    _initialize_fire(firePixels)
+    _voxels_baked = False
 
 
-scene = Scene(exposure=1, voxel_edges=0)
-scene.set_background_color((0, 0, 0))
+@ti.kernel
+def _initialize_fire(pixels: ti.template()):
+    for x, z in ti.ndrange(FIRE_WIDTH, FIRE_DEPTH):
+        pixels[x, FIRE_HEIGHT - 1, z] = ti.cast(MAX_INTENSITY, ti.u8)
 
 
 def set_camera_pos(pos):
@@ -158,10 +309,15 @@ def set_background_color(color):
     scene.set_background_color(color)
 
 
-def render_scene(passes=1):
-    scene.renderer.read_fire_pixels(firePixels, colors)
+def render_scene(passes=1, out=None):
+    global _voxels_baked
+    if not _voxels_baked:
+        scene.renderer.read_fire_pixels(firePixels, colors)
+        _voxels_baked = True
+    if passes == 1 and out is not None:
+        return scene.renderer.render_once(out)
     scene.renderer.reset_framebuffer()
     for n in range(passes):
         scene.renderer.accumulate()
-    img = scene.renderer.fetch_image()
+    img = scene.renderer.fetch_image(out)
     return img
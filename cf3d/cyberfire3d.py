@@ -1,3 +1,4 @@
+import math
 import sys
 import time
 from typing import Dict
@@ -8,8 +9,9 @@ from PySide6.QtGui import QImage, QPixmap, QWheelEvent
 from PySide6.QtWidgets import (QApplication, QHBoxLayout, QLabel, QMainWindow,
                                QPushButton, QSlider, QVBoxLayout, QWidget)
 
-from core import (FIRE_DEPTH, FIRE_HEIGHT, FIRE_WIDTH, do_fire, firePixels,
-                  get_palette_list, initialize_fire, render_scene, scene)
+import core
+from core import (FIRE_DEPTH, FIRE_HEIGHT, FIRE_WIDTH, clear_fire, do_fire,
+                  get_palette_list, init_3d, initialize_fire, render_scene)
 
 
 class FireWindow(QMainWindow):
@@ -17,7 +19,7 @@ class FireWindow(QMainWindow):
         super().__init__()
         self.current_time = 0
         self.brush_radius = 25
-        self.brush_changed = time.time() - 10
+        self.brush_changed = time.monotonic() - 10
         self.mx = 0.5
         self.my = 0.5
         self.render_passes = 1  # New: number of render passes
@@ -26,17 +28,16 @@ class FireWindow(QMainWindow):
         self.camera_yaw = -np.pi / 2  # Start facing into the scene
         self.camera_pitch = -0.3  # Slightly above
         self.camera_distance = 2.5
-        self.camera_target = np.array(
-            [FIRE_WIDTH / 2, FIRE_HEIGHT / 2, FIRE_DEPTH / 2], dtype=np.float32
-        )
+        self.camera_target = (FIRE_WIDTH / 2, FIRE_HEIGHT / 2, FIRE_DEPTH / 2)
         self.last_mouse_pos = None
         self.is_dragging = False
         self.is_panning = False
+        self._camera_key = None
         # --- Pan state ---
         self.camera_pan_x = 0.0
         self.camera_pan_y = 0.0
         # --- FPS Counter ---
-        self.last_fps_time = time.time()
+        self.last_fps_time = time.monotonic()
         self.frame_count = 0
         self.fps = 0
         # Use palette list from core.py
@@ -44,6 +45,10 @@ class FireWindow(QMainWindow):
         self.palette_idx = 0
         self.palettes[self.palette_idx][1]()
         self.setWindowTitle("Fire Effect (PySide6)")
+        # Frame buffer and the QImage viewing it are created once and reused
+        w, h = core.scene.renderer.image_res
+        self.frame = np.empty((h, w, 4), dtype=np.uint8)
+        self.qimg = QImage(self.frame.data, w, h, w * 4, QImage.Format.Format_RGB32)
         self.label = QLabel(self)
         central_widget = QWidget(self)
         self.setCentralWidget(central_widget)
@@ -81,7 +86,7 @@ class FireWindow(QMainWindow):
 
     @imx.setter
     def imx(self, value):
-        self.mx = np.clip(value / FIRE_WIDTH, 0, 1)
+        self.mx = max(0.0, min(value / FIRE_WIDTH, 1.0))
 
     @property
     def imy(self):
@@ -89,7 +94,19 @@ class FireWindow(QMainWindow):
 
     @imy.setter
     def imy(self, value):
-        self.my = np.clip(value / FIRE_HEIGHT, 0, 1)
+        self.my = max(0.0, min(value / FIRE_HEIGHT, 1.0))
+
+    # The target is kept as three floats so the camera math never indexes arrays
+    @property
+    def camera_target(self):
+        return self.camera_target_x, self.camera_target_y, self.camera_target_z
+
+    @camera_target.setter
+    def camera_target(self, value):
+        x, y, z = value
+        self.camera_target_x = float(x)
+        self.camera_target_y = float(y)
+        self.camera_target_z = float(z)
 
     def init_sidepanel(self):
         panel = QWidget()
@@ -140,17 +157,15 @@ class FireWindow(QMainWindow):
             label.setText(f"Render Passes: {val}")
 
     def reset_all(self):
-        firePixels.fill(0)
+        clear_fire()
         initialize_fire()
-        scene.renderer.recompute_bbox()
+        core.scene.renderer.recompute_bbox()
         self.palettes[self.palette_idx][1]()
         # Reset camera
         self.camera_yaw = 0.0
         self.camera_pitch = 0.0
         self.camera_distance = 2.5
-        self.camera_target = np.array(
-            [FIRE_WIDTH / 2, FIRE_HEIGHT / 2, FIRE_DEPTH / 2], dtype=np.float32
-        )
+        self.camera_target = (FIRE_WIDTH / 2, FIRE_HEIGHT / 2, FIRE_DEPTH / 2)
         self.is_dragging = False
         self.is_panning = False
         self.last_mouse_pos = None
@@ -164,16 +179,14 @@ class FireWindow(QMainWindow):
 
     def frame_fire(self):
         # Recompute bbox
-        scene.renderer.recompute_bbox()
-        bbox_min = np.array(scene.renderer.bbox[0].to_numpy(), dtype=np.float32)
-        bbox_max = np.array(scene.renderer.bbox[1].to_numpy(), dtype=np.float32)
-        center = (bbox_min + bbox_max) / 2.0
-        size = bbox_max - bbox_min
+        core.scene.renderer.recompute_bbox()
+        bbox_min = core.scene.renderer.bbox[0].to_numpy().tolist()
+        bbox_max = core.scene.renderer.bbox[1].to_numpy().tolist()
         # Set camera target to center
-        self.camera_target = center.astype(np.float32)
+        self.camera_target = [(lo + hi) / 2.0 for lo, hi in zip(bbox_min, bbox_max)]
         # Set camera distance to fit the bbox
-        max_extent = np.linalg.norm(size)
-        self.camera_distance = float(max_extent * 0.7 + 2.5)  # Add margin
+        max_extent = math.dist(bbox_min, bbox_max)
+        self.camera_distance = max_extent * 0.7 + 2.5  # Add margin
         # Set camera angles to a default isometric view
         self.camera_yaw = -np.pi / 4
         self.camera_pitch = -np.pi / 6
@@ -204,19 +217,16 @@ class FireWindow(QMainWindow):
             # Orbit: update yaw/pitch
             self.camera_yaw += dx * 0.01
             self.camera_pitch -= dy * 0.01
-            self.camera_pitch = np.clip(
-                self.camera_pitch, -np.pi / 2 + 0.05, np.pi / 2 - 0.05
+            self.camera_pitch = max(
+                -math.pi / 2 + 0.05, min(self.camera_pitch, math.pi / 2 - 0.05)
             )
         elif self.is_panning:
-            # Pan: move target in camera's right/world up plane
-            cam_pos, look_at, up = self.compute_camera()
-            forward = look_at - cam_pos
-            forward /= np.linalg.norm(forward)
-            right = np.cross(forward, np.array([0, 1, 0], dtype=np.float32))
-            right /= np.linalg.norm(right)
-            up_vec = np.array([0, 1, 0], dtype=np.float32)
+            # Pan: move target in camera's right/world up plane. The camera's
+            # right vector is (sin(yaw), 0, -cos(yaw)) for any pitch.
             pan_speed = self.camera_distance * 0.002
-            self.camera_target -= right * (dx * pan_speed) + up_vec * (dy * pan_speed)
+            self.camera_target_x -= math.sin(self.camera_yaw) * dx * pan_speed
+            self.camera_target_y -= dy * pan_speed
+            self.camera_target_z += math.cos(self.camera_yaw) * dx * pan_speed
         self.last_mouse_pos = pos
 
     def mouseReleaseEvent(self, event):
@@ -229,53 +239,55 @@ class FireWindow(QMainWindow):
 
     def wheelEvent(self, event: QWheelEvent):
         delta = event.angleDelta().y() / 120
-        self.camera_distance *= np.exp(-delta * 0.1)
-        self.camera_distance = np.clip(self.camera_distance, 0.1, 100.0)
+        self.camera_distance *= math.exp(-delta * 0.1)
+        self.camera_distance = max(0.1, min(self.camera_distance, 100.0))
         event.accept()
 
     def compute_camera(self):
-        # Spherical coordinates to cartesian
-        pitch = self.camera_pitch
-        yaw = self.camera_yaw
+        # Spherical coordinates to cartesian, on plain floats since NumPy's
+        # per-call overhead outweighs math this small
+        cos_pitch = math.cos(self.camera_pitch)
+        sin_pitch = math.sin(self.camera_pitch)
+        cos_yaw = math.cos(self.camera_yaw)
+        sin_yaw = math.sin(self.camera_yaw)
         r = self.camera_distance
-        target = self.camera_target
+        tx, ty, tz = self.camera_target
         # Camera position in world space
-        x = target[0] + r * np.cos(pitch) * np.cos(yaw)
-        y = target[1] + r * np.sin(pitch)
-        z = target[2] + r * np.cos(pitch) * np.sin(yaw)
-        cam_pos = np.array([x, y, z], dtype=np.float32)
-        # Calculate up vector based on pitch/yaw
-        # This keeps the up vector perpendicular to the view direction
-        up = np.array([0, 1, 0], dtype=np.float32)
-        view = target - cam_pos
-        view /= np.linalg.norm(view)
-        right = np.cross(up, view)
-        right /= np.linalg.norm(right)
-        up_corrected = np.cross(view, right)
-        up_corrected /= np.linalg.norm(up_corrected)
-        return cam_pos, target, up_corrected
+        cam_pos = (
+            tx + r * cos_pitch * cos_yaw,
+            ty + r * sin_pitch,
+            tz + r * cos_pitch * sin_yaw,
+        )
+        # Up vector perpendicular to the view direction: the closed form of
+        # normalize(cross(view, normalize(cross(world_up, view))))
+        up = (-sin_pitch * cos_yaw, cos_pitch, -sin_pitch * sin_yaw)
+        return cam_pos, (tx, ty, tz), up
 
     def update_frame(self):
         self.current_time += 0.05
-        do_fire(self.current_time)
-        cam_pos, look_at, up = self.compute_camera()
-        scene.renderer.set_camera_pos(*cam_pos)
-        scene.renderer.set_look_at(*look_at)
-        scene.set_up(up)
-        image = render_scene(self.render_passes)
-        np_img = image.to_numpy()
-        np_img = np.rot90(np_img)
-        np_img = np.flipud(np_img)
-        np_img = np.clip(np_img, 0, 1)
-        np_img = np.astype(np_img * 255, np.uint8).copy()
-        h, w, ch = np_img.shape
-        bytes_per_line = ch * w
-        qimg = QImage(np_img.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-        self.label.setPixmap(QPixmap.fromImage(qimg))
-        scene.renderer.reset_framebuffer()
+        # Nothing is visible while minimized, so only advance the simulation
+        if self.isMinimized():
+            do_fire(self.current_time)
+            return
+        # Otherwise the step writes the renderer's voxels on the way
+        do_fire(self.current_time, bake=True)
+        # The camera only moves on user input, so skip re-uploading it otherwise
+        camera_key = (
+            self.camera_yaw,
+            self.camera_pitch,
+            self.camera_distance,
+            *self.camera_target,
+        )
+        if camera_key != self._camera_key:
+            self._camera_key = camera_key
+            cam_pos, look_at, up = self.compute_camera()
+            core.scene.renderer.set_camera(cam_pos, look_at, up)
+        # The renderer writes upright RGB32 (BGRX) rows straight into frame
+        render_scene(self.render_passes, out=self.frame)
+        self.label.setPixmap(QPixmap.fromImage(self.qimg))
         # --- FPS Counter update ---
         self.frame_count += 1
-        now = time.time()
+        now = time.monotonic()
         elapsed_fps = now - self.last_fps_time
         if elapsed_fps >= 0.25:
             self.fps = int(self.frame_count / elapsed_fps)
@@ -285,6 +297,7 @@ class FireWindow(QMainWindow):
 
 
 def main():
+    init_3d()
     app = QApplication(sys.argv)
     win = FireWindow()
     win.show()
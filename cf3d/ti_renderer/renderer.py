@@ -1,14 +1,32 @@
 from typing import Self
 
+import numpy as np
 import taichi as ti
 
 from constants import FIRE_WIDTH, MAX_INTENSITY
 from ti_renderer.math_utils import eps, inf, out_dir, ray_aabb_intersection
 
 MAX_RAY_DEPTH = 4
-use_directional_light = True
 
 DIS_LIMIT = 100
+ROULETTE_THRESHOLD = 0.1
+SHADOW_ROULETTE_THRESHOLD = 0.05
+VOXEL_TILE = 8
+JITTER_SAMPLES = 256
+
+
+def halton_table(n):
+    # First n points of the 2D Halton sequence (bases 2 and 3), skipping (0, 0)
+    table = np.zeros((n, 2), dtype=np.float32)
+    for dim, base in enumerate((2, 3)):
+        for i in range(n):
+            f, r, k = 1.0, 0.0, i + 1
+            while k > 0:
+                f /= base
+                r += f * (k % base)
+                k //= base
+            table[i, dim] = r
+    return table
 
 
 @ti.data_oriented
@@ -20,13 +38,15 @@ class Renderer:
         self.vignette_radius = 0.0
         self.vignette_center = [0.5, 0.5]
         self.current_spp = 0
+        self._preview_frame = 0
 
         self.color_buffer = ti.Vector.field(3, dtype=ti.f32)
         self.bbox = ti.Vector.field(3, dtype=ti.f32, shape=2)
         self.fov = ti.field(dtype=ti.f32, shape=())
         self.voxel_color = ti.Vector.field(3, dtype=ti.u8)
         self.voxel_material = ti.field(dtype=ti.i8)
-        self._voxel_alpha = ti.field(dtype=ti.f32)
+        # Hit probability in 1/255 steps; it only feeds a random threshold test
+        self._voxel_alpha = ti.field(dtype=ti.u8)
 
         self.light_direction = ti.Vector.field(3, dtype=ti.f32, shape=())
         self.light_direction_noise = ti.field(dtype=ti.f32, shape=())
@@ -34,6 +54,11 @@ class Renderer:
 
         self.cast_voxel_hit = ti.field(ti.i32, shape=())
         self.cast_voxel_index = ti.Vector.field(3, ti.i32, shape=())
+        # The cast-voxel highlight is compiled into a separate render variant,
+        # used only while this is set
+        self.highlight_cast_voxel = False
+        # Likewise each lighting mode gets its own specialised trace
+        self.use_directional_light = True
 
         self.voxel_edges = voxel_edges
         self.exposure = exposure
@@ -41,8 +66,14 @@ class Renderer:
         self.camera_pos = ti.Vector.field(3, dtype=ti.f32, shape=())
         self.look_at = ti.Vector.field(3, dtype=ti.f32, shape=())
         self.up = ti.Vector.field(3, dtype=ti.f32, shape=())
+        # View basis shared by every primary ray, refreshed by the camera setters
+        self.cam_fwd = ti.Vector.field(3, dtype=ti.f32, shape=())
+        self.cam_du = ti.Vector.field(3, dtype=ti.f32, shape=())
+        self.cam_dv = ti.Vector.field(3, dtype=ti.f32, shape=())
 
         self.background_color = ti.Vector.field(3, dtype=ti.f32, shape=())
+        # Sub-pixel offsets for primary rays, stratified instead of random
+        self.jitter = ti.Vector.field(2, dtype=ti.f32, shape=JITTER_SAMPLES)
 
         self.voxel_dx = dx
         self.voxel_inv_dx = 1 / dx
@@ -51,12 +82,19 @@ class Renderer:
 
         self.voxel_grid_res = FIRE_WIDTH
 
+        # Kept AoS: every pass reads or writes a pixel's three channels together,
+        # and placing the channels apart (SoA) measured no faster
         ti.root.dense(ti.ij, image_res).place(self.color_buffer)
-        ti.root.dense(ti.ijk, self.voxel_grid_res).place(
+        # Voxels are stored in 8^3 tiles so a ray's neighbouring cells share cache
+        # lines; the grid is padded up to a whole number of tiles
+        tiles = -(-self.voxel_grid_res // VOXEL_TILE)
+        ti.root.dense(ti.ijk, tiles).dense(ti.ijk, VOXEL_TILE).place(
             self.voxel_color, self.voxel_material, self._voxel_alpha
         )
 
-        self._rendered_image = ti.Vector.field(3, float, image_res)
+        # Final 8-bit image, row-major (height, width) so it can back a QImage
+        self._rendered_image = ti.Vector.field(3, ti.u8, (image_res[1], image_res[0]))
+        self.jitter.from_numpy(halton_table(JITTER_SAMPLES))
         self.set_up(*up)
         self.set_fov(0.23)
 
@@ -72,18 +110,6 @@ class Renderer:
         self.light_direction_noise[None] = light_direction_noise
         self.light_color[None] = light_color
 
-    def set_camera_pos(self, x, y, z):
-        self.camera_pos[None] = ti.Vector([x, y, z])
-
-    def set_look_at(self, x, y, z):
-        self.look_at[None] = ti.Vector([x, y, z])
-
-    def set_up(self, x, y, z):
-        self.up[None] = ti.Vector([x, y, z]).normalized()
-
-    def set_fov(self, fov):
-        self.fov[None] = fov
-
     def set_background_color(self, color):
         self.background_color[None] = color
 
@@ -112,28 +138,26 @@ class Renderer:
 
     @ti.func
     def voxel_surface_color(self, pos):
+        # Index and in-voxel position from a single scale and floor
         p = pos * self.voxel_inv_dx
-        p -= ti.floor(p)
-        voxel_index = self._to_voxel_index(pos)
+        cell = ti.floor(p)
+        voxel_index = cell.cast(ti.i32)
+        p -= cell
 
+        # Near an edge when at least two coordinates are near a face
         boundary = self.voxel_edges
-        count = 0
-        for i in ti.static(range(3)):
-            if p[i] < boundary or p[i] > 1 - boundary:
-                count += 1
-
-        f = 0.0
-        if count >= 2:
-            f = 1.0
+        near_face = (p < boundary) | (p > 1 - boundary)
+        f = ti.select(near_face.cast(ti.i32).sum() >= 2, 1.0, 0.0)
 
         voxel_color = ti.Vector([0.0, 0.0, 0.0])
         is_light = 0
         if self.inside_particle_grid(voxel_index):
-            voxel_color = self.voxel_color[voxel_index] * (1.0 / 255)
+            # Edge darkening and the 8-bit to unit scale in one multiply per channel
+            voxel_color = self.voxel_color[voxel_index] * ((1.3 - 1.2 * f) / 255)
             if self.voxel_material[voxel_index] == 2:
                 is_light = 1
 
-        return voxel_color * (1.3 - 1.2 * f), is_light
+        return voxel_color, is_light
 
     @ti.func
     def ray_march(self, p, d):
@@ -150,13 +174,6 @@ class Renderer:
         for i in ti.static(range(3)):
             if abs(d[i]) < 1e-6:
                 d[i] = 1e-6
-        rinv = 1.0 / d
-        rsign = ti.Vector([0, 0, 0])
-        for i in ti.static(range(3)):
-            if d[i] > 0:
-                rsign[i] = 1
-            else:
-                rsign[i] = -1
 
         bbox_min = self.bbox[0]
         bbox_max = self.bbox[1]
@@ -167,7 +184,16 @@ class Renderer:
         c = ti.Vector([0.0, 0.0, 0.0])
         voxel_index = ti.Vector([0, 0, 0])
         hit_found = 0
+        # Rays that miss the bbox skip the traversal setup entirely
         if inter:
+            rinv = 1.0 / d
+            rsign = ti.Vector([0, 0, 0])
+            for i in ti.static(range(3)):
+                if d[i] > 0:
+                    rsign[i] = 1
+                else:
+                    rsign[i] = -1
+
             near = max(0, near)
 
             pos = eye_pos + d * (near + 5 * eps)
@@ -175,50 +201,37 @@ class Renderer:
             o = self.voxel_inv_dx * pos
             ipos = ti.floor(o).cast(ti.i32)
             dis = (ipos - o + 0.5 + rsign * 0.5) * rinv
-            running = 1
-            i = 0
             hit_pos = ti.Vector([0.0, 0.0, 0.0])
-            while running:
+            # Each step crosses one cell face, so the segment's length in cells
+            # along each axis bounds the walk; the grid check still ends it first
+            max_steps = (
+                ti.cast(ti.abs(d).sum() * (far - near) * self.voxel_inv_dx, ti.i32) + 4
+            )
+            for _ in range(max_steps):
                 if not self.inside_particle_grid(ipos):
-                    running = 0
-                else:
-                    last_sample = self.voxel_material[ipos]
-                    if last_sample != 0:  # Only treat nonzero material as a hit
-                        # --- Alpha hit test ---
-                        alpha = self._voxel_alpha[ipos]
-                        if ti.random() < alpha:
-                            mini = (
-                                ipos - o + ti.Vector([0.5, 0.5, 0.5]) - rsign * 0.5
-                            ) * rinv
-                            hit_distance = mini.max() * self.voxel_dx + near
-                            hit_pos = eye_pos + (hit_distance + 1e-3) * d
-                            voxel_index = self._to_voxel_index(hit_pos)
-                            c, hit_light = self.voxel_surface_color(hit_pos)
-                            running = 0
-                            hit_found = 1
-                        else:
-                            mm = ti.Vector([0, 0, 0])
-                            if dis[0] <= dis[1] and dis[0] < dis[2]:
-                                mm[0] = 1
-                            elif dis[1] <= dis[0] and dis[1] <= dis[2]:
-                                mm[1] = 1
-                            else:
-                                mm[2] = 1
-                            dis += mm * rsign * rinv
-                            ipos += mm * rsign
-                            normal = -mm * rsign
-                    else:
-                        mm = ti.Vector([0, 0, 0])
-                        if dis[0] <= dis[1] and dis[0] < dis[2]:
-                            mm[0] = 1
-                        elif dis[1] <= dis[0] and dis[1] <= dis[2]:
-                            mm[1] = 1
-                        else:
-                            mm[2] = 1
-                        dis += mm * rsign * rinv
-                        ipos += mm * rsign
-                        normal = -mm * rsign
-                i += 1
+                    break
+                # Alpha is only nonzero where there is material, so one load
+                # serves as both the occupancy and the alpha hit test
+                alpha = self._voxel_alpha[ipos]
+                if alpha > 0:
+                    if ti.random() * 255 < alpha:
+                        mini = (
+                            ipos - o + ti.Vector([0.5, 0.5, 0.5]) - rsign * 0.5
+                        ) * rinv
+                        hit_distance = mini.max() * self.voxel_dx + near
+                        hit_pos = eye_pos + (hit_distance + 1e-3) * d
+                        voxel_index = self._to_voxel_index(hit_pos)
+                        c, hit_light = self.voxel_surface_color(hit_pos)
+                        hit_found = 1
+                        break
+                # Step along the axis with the nearest face, picked with selects
+                # rather than branches; ties resolve x, then y, then z as before
+                a = ti.i32(dis[0] <= dis[1]) & ti.i32(dis[0] < dis[2])
+                b = (1 - a) & ti.i32(dis[1] <= dis[0]) & ti.i32(dis[1] <= dis[2])
+                mm = ti.Vector([a, b, 1 - a - b])
+                dis += mm * rsign * rinv
+                ipos += mm * rsign
+                normal = -mm * rsign
         return hit_distance, normal, c, hit_light, voxel_index, hit_found
 
     @ti.func
@@ -234,7 +247,7 @@ class Renderer:
         )
 
     @ti.func
-    def next_hit(self, pos, d, t):
+    def next_hit(self, pos, d, t, highlight: ti.template()):
         closest = inf
         normal = ti.Vector([0.0, 0.0, 0.0])
         c = ti.Vector([0.0, 0.0, 0.0])
@@ -249,142 +262,210 @@ class Renderer:
             hit_found = 1
 
         # Highlight the selected voxel
-        if self.cast_voxel_hit[None]:
-            cast_vx_idx = self.cast_voxel_index[None]
-            if all(cast_vx_idx == vx_idx):
-                c = ti.Vector([1.0, 0.65, 0.0])
-                # For light sources, we actually invert the material to make it
-                # more obvious
-                hit_light = 1 - hit_light
-                # hit_light=hit/
+        if ti.static(highlight):
+            if self.cast_voxel_hit[None]:
+                cast_vx_idx = self.cast_voxel_index[None]
+                if all(cast_vx_idx == vx_idx):
+                    c = ti.Vector([1.0, 0.65, 0.0])
+                    # For light sources, we actually invert the material to make
+                    # it more obvious
+                    hit_light = 1 - hit_light
+                    # hit_light=hit/
         return closest, normal, c, hit_light, hit_found
 
     @ti.kernel
     def set_camera_pos(self, x: float, y: float, z: float):
         self.camera_pos[None] = ti.Vector([x, y, z])
+        self._update_camera_basis()
 
     @ti.kernel
     def set_up(self, x: float, y: float, z: float):
         self.up[None] = ti.math.normalize(ti.Vector([x, y, z]))
+        self._update_camera_basis()
 
     @ti.kernel
     def set_look_at(self, x: float, y: float, z: float):
         self.look_at[None] = ti.Vector([x, y, z])
+        self._update_camera_basis()
+
+    @ti.kernel
+    def set_camera(self, pos: ti.math.vec3, look_at: ti.math.vec3, up: ti.math.vec3):
+        # One launch and one basis update for a whole camera move
+        self.camera_pos[None] = pos
+        self.look_at[None] = look_at
+        self.up[None] = ti.math.normalize(up)
+        self._update_camera_basis()
+
+    @ti.func
+    def _update_camera_basis(self):
+        d = ti.math.normalize(self.look_at[None] - self.camera_pos[None])
+        du = ti.math.normalize(ti.math.cross(d, self.up[None]))
+        self.cam_fwd[None] = d
+        self.cam_du[None] = du
+        self.cam_dv[None] = ti.math.normalize(ti.math.cross(du, d))
 
     @ti.kernel
     def set_fov(self, fov: float):
         self.fov[None] = fov
 
     @ti.func
-    def get_cast_dir(self, u, v):
+    def get_cast_dir(self, u, v, sample):
         fov = self.fov[None]
-        d = ti.math.normalize(self.look_at[None] - self.camera_pos[None])
+        # Each pixel walks the Halton table from its own hashed offset, so
+        # neighbouring pixels never share a jitter pattern
+        jitter = self.jitter[(sample + u * 7919 + v * 6151) & (JITTER_SAMPLES - 1)]
         fu = (
-            2 * fov * (u + ti.random(ti.f32)) / self.image_res[1]
+            2 * fov * (u + jitter[0]) / self.image_res[1]
             - fov * self.aspect_ratio
             - 1e-5
         )
-        fv = 2 * fov * (v + ti.random(ti.f32)) / self.image_res[1] - fov - 1e-5
-        du = ti.math.normalize(ti.math.cross(d, self.up[None]))
-        dv = ti.math.normalize(ti.math.cross(du, d))
-        d = ti.math.normalize(d + fu * du + fv * dv)
-        return d
+        fv = 2 * fov * (v + jitter[1]) / self.image_res[1] - fov - 1e-5
+        d = self.cam_fwd[None] + fu * self.cam_du[None] + fv * self.cam_dv[None]
+        return ti.math.normalize(d)
 
-    @ti.kernel
-    def render(self):
-        ti.loop_config(block_dim=256)
-        for u, v in self.color_buffer:
-            d = self.get_cast_dir(u, v)
-            pos = self.camera_pos[None]
-            t = 0.0
-
-            contrib = ti.Vector([0.0, 0.0, 0.0])
-            throughput = ti.Vector([1.0, 1.0, 1.0])
-            c = ti.Vector([1.0, 1.0, 1.0])
-
-            depth = 0
-            hit_light = 0
-            hit_background = 0
-            hit_found = 0
-
-            # Tracing begin
-            for bounce in range(MAX_RAY_DEPTH):
-                depth += 1
-                closest, normal, c, hit_light, hit_found = self.next_hit(pos, d, t)
-                hit_pos = pos + closest * d
-                if (
-                    hit_found
-                    and not hit_light
-                    and ti.math.length(normal) != 0
-                    and closest < 1e8
-                ):
-                    d = out_dir(normal)
-                    pos = hit_pos + 1e-4 * d
-                    throughput *= c
-
-                    if ti.static(use_directional_light):
-                        dir_noise = (
-                            ti.Vector(
-                                [
-                                    ti.random() - 0.5,
-                                    ti.random() - 0.5,
-                                    ti.random() - 0.5,
-                                ]
-                            )
-                            * self.light_direction_noise[None]
-                        )
-                        light_dir = ti.math.normalize(
-                            self.light_direction[None] + dir_noise
+    @ti.func
+    def _trace(self, u, v, sample, highlight: ti.template(), light: ti.template()):
+        d = self.get_cast_dir(u, v, sample)
+        pos = self.camera_pos[None]
+        t = 0.0
+
+        contrib = ti.Vector([0.0, 0.0, 0.0])
+        throughput = ti.Vector([1.0, 1.0, 1.0])
+        c = ti.Vector([1.0, 1.0, 1.0])
+
+        depth = 0
+        hit_light = 0
+        hit_background = 0
+        hit_found = 0
+
+        # Tracing begin
+        for bounce in range(MAX_RAY_DEPTH):
+            depth += 1
+            closest, normal, c, hit_light, hit_found = self.next_hit(
+                pos, d, t, highlight
+            )
+            hit_pos = pos + closest * d
+            # A hit in the ray's entry voxel has no face normal; normals are axis
+            # aligned, so comparing components stands in for taking the length
+            if hit_found and not hit_light and any(normal != 0) and closest < 1e8:
+                d = out_dir(normal)
+                pos = hit_pos + 1e-4 * d
+                throughput *= c
+
+                # Russian roulette: a dim path is dropped or reweighted, keeping
+                # the estimate unbiased while sparing its shadow ray and bounces
+                max_c = throughput.max()
+                if max_c < ROULETTE_THRESHOLD:
+                    if ti.random() >= max_c:
+                        break
+                    throughput /= max_c
+
+                if ti.static(light):
+                    dir_noise = (
+                        ti.Vector(
+                            [
+                                ti.random() - 0.5,
+                                ti.random() - 0.5,
+                                ti.random() - 0.5,
+                            ]
                         )
-                        dot = light_dir.dot(normal)
-                        if dot > 0:
+                        * self.light_direction_noise[None]
+                    )
+                    light_dir = ti.math.normalize(
+                        self.light_direction[None] + dir_noise
+                    )
+                    dot = light_dir.dot(normal)
+                    if dot > 0:
+                        # Faint shadow rays get the same roulette as dim paths,
+                        # so most of them skip the DDA without biasing the sum
+                        light_contrib = throughput * self.light_color[None] * dot
+                        max_l = light_contrib.max()
+                        cast_shadow = 1
+                        if max_l < SHADOW_ROULETTE_THRESHOLD:
+                            if ti.random() * SHADOW_ROULETTE_THRESHOLD >= max_l:
+                                cast_shadow = 0
+                            else:
+                                light_contrib *= SHADOW_ROULETTE_THRESHOLD / max_l
+                        if cast_shadow:
                             hit_light_ = 0
-                            dist, _, _, hit_light_, _ = self.next_hit(pos, light_dir, t)
+                            # Only the distance matters here, so never highlight
+                            dist, _, _, hit_light_, _ = self.next_hit(
+                                pos, light_dir, t, False
+                            )
                             if dist > DIS_LIMIT:
                                 # far enough to hit directional light
-                                contrib += throughput * self.light_color[None] * dot
-                else:  # hit background or light voxel, terminate tracing
-                    hit_background = 1
-                    break
+                                contrib += light_contrib
+            else:  # hit background or light voxel, terminate tracing
+                hit_background = 1
+                break
+        # Tracing end
+
+        if hit_light:
+            contrib += throughput * c
+        else:
+            if depth == 1 and hit_background:
+                # Direct hit to background
+                contrib = self.background_color[None]
+        return contrib
+
+    @ti.kernel
+    def render(self, sample: int, highlight: ti.template(), light: ti.template()):
+        ti.loop_config(block_dim=256)
+        for u, v in self.color_buffer:
+            self.color_buffer[u, v] += self._trace(u, v, sample, highlight, light)
+
+    @ti.func
+    def _tonemap(self, i, j, radiance, samples):
+        u = 1.0 * i / self.image_res[0]
+        v = 1.0 * j / self.image_res[1]
+
+        darken = 1.0 - self.vignette_strength * max(
+            (
+                ti.sqrt(
+                    (u - self.vignette_center[0]) ** 2
+                    + (v - self.vignette_center[1]) ** 2
+                )
+                - self.vignette_radius
+            ),
+            0,
+        )
 
-                # Russian roulette
-                # max_c = throughput.max()
-                # if ti.random() > max_c:
-                #     throughput = [0, 0, 0]
-                #     break
-                # else:
-                #     throughput /= max_c
-            # Tracing end
-
-            if hit_light:
-                contrib += throughput * c
-            else:
-                if depth == 1 and hit_background:
-                    # Direct hit to background
-                    contrib = self.background_color[None]
-            self.color_buffer[u, v] += contrib
+        color = ti.sqrt(radiance * darken * self.exposure / samples)
+        return self.to_vec3u(color)
 
     @ti.kernel
     def _render_to_image(self, samples: int):
         for i, j in self.color_buffer:
-            u = 1.0 * i / self.image_res[0]
-            v = 1.0 * j / self.image_res[1]
-
-            darken = 1.0 - self.vignette_strength * max(
-                (
-                    ti.sqrt(
-                        (u - self.vignette_center[0]) ** 2
-                        + (v - self.vignette_center[1]) ** 2
-                    )
-                    - self.vignette_radius
-                ),
-                0,
+            self._rendered_image[j, i] = self._tonemap(
+                i, j, self.color_buffer[i, j], samples
             )
 
-            for cidx in ti.static(range(3)):
-                self._rendered_image[i, j][cidx] = ti.sqrt(
-                    self.color_buffer[i, j][cidx] * darken * self.exposure / samples
-                )
+    @ti.kernel
+    def _render_to_array(self, samples: int, out: ti.types.ndarray()):
+        for i, j in self.color_buffer:
+            color = self._tonemap(i, j, self.color_buffer[i, j], samples)
+            self._store_bgrx(out, i, j, color)
+
+    @ti.kernel
+    def _render_once_to_array(
+        self,
+        out: ti.types.ndarray(),
+        sample: int,
+        highlight: ti.template(),
+        light: ti.template(),
+    ):
+        ti.loop_config(block_dim=256)
+        for u, v in self.color_buffer:
+            radiance = self._trace(u, v, sample, highlight, light)
+            color = self._tonemap(u, v, radiance, 1)
+            self._store_bgrx(out, u, v, color)
+
+    @ti.func
+    def _store_bgrx(self, out: ti.template(), i, j, color):
+        # B, G, R, 255 so the buffer can back a QImage in RGB32 directly
+        for c in ti.static(range(3)):
+            out[j, i, c] = color[2 - c]
+        out[j, i, 3] = ti.cast(255, ti.u8)
 
     @ti.kernel
     def recompute_bbox(self):
@@ -402,12 +483,31 @@ class Renderer:
         self.color_buffer.fill(0)
 
     def accumulate(self):
-        self.render()
+        self.render(
+            self.current_spp, self.highlight_cast_voxel, self.use_directional_light
+        )
         self.current_spp += 1
 
-    def fetch_image(self):
-        self._render_to_image(self.current_spp)
-        return self._rendered_image
+    def fetch_image(self, out=None):
+        if out is None:
+            self._render_to_image(self.current_spp)
+            return self._rendered_image
+        # Tone map straight into the caller's buffer, skipping the field
+        self._render_to_array(self.current_spp, out)
+        return out
+
+    def render_once(self, out):
+        # A single sample is tone mapped as soon as its ray finishes, so
+        # color_buffer is neither cleared, accumulated into, nor read back
+        self._render_once_to_array(
+            out,
+            self._preview_frame,
+            self.highlight_cast_voxel,
+            self.use_directional_light,
+        )
+        # Successive previews step through the jitter sequence too
+        self._preview_frame += 1
+        return out
 
     @staticmethod
     @ti.func
@@ -430,6 +530,8 @@ class Renderer:
     def set_voxel(self, idx, mat, color):
         self.voxel_material[idx] = ti.cast(mat, ti.i8)
         self.voxel_color[idx] = self.to_vec3u(color)
+        if mat == 0:
+            self._voxel_alpha[idx] = ti.cast(0, ti.u8)
 
     @ti.func
     def get_voxel(self, ijk):
@@ -444,19 +546,31 @@ class Renderer:
             (1, self.voxel_grid_res - 1),
             (1, self.voxel_grid_res - 1),
         ):
-            intensity = firePixels[x, y, z]
-            if intensity > 0:
-                color = colors[intensity]
-                mat = 2
-                self.voxel_material[x, y, z] = mat
-                self.voxel_color[x, y, z] = ti.Vector([color[0], color[1], color[2]])
-                v = ti.cast(intensity, ti.f32) / MAX_INTENSITY
-                self._voxel_alpha[x, y, z] = (v * v) / 2
-            else:
-                self.voxel_material[x, y, z] = 0
-                self.voxel_color[x, y, z] = ti.Vector([0, 0, 0])
-                self._voxel_alpha[x, y, z] = 0.0
-            if y == self.voxel_grid_res - 2:
-                self._voxel_alpha[x, y, z] = 1
-                self.voxel_color[x, y, z] = ti.Vector([0, 0, 0])
-                self.voxel_material[x, y, z] = 1
+            self._bake_fire_voxel(x, y, z, firePixels[x, y, z], colors)
+
+    @ti.func
+    def bake_fire_voxel(self, x, y, z, intensity, colors: ti.template()):
+        # For kernels that visit every fire voxel anyway; cells outside the
+        # range read_fire_pixels covers are left alone
+        hi = self.voxel_grid_res - 1
+        if 1 <= x < hi and 1 <= y < hi and 1 <= z < hi:
+            self._bake_fire_voxel(x, y, z, intensity, colors)
+
+    @ti.func
+    def _bake_fire_voxel(self, x, y, z, intensity, colors: ti.template()):
+        if intensity > 0:
+            rgb = colors[ti.cast(intensity, ti.i32)]
+            self.voxel_material[x, y, z] = ti.cast(2, ti.i8)
+            for c in ti.static(range(3)):
+                self.voxel_color[x, y, z][c] = ti.cast((rgb >> (8 * c)) & 0xFF, ti.u8)
+            v = ti.cast(intensity, ti.f32) / MAX_INTENSITY
+            self._voxel_alpha[x, y, z] = ti.cast(v * v * 127.5 + 0.5, ti.u8)
+        elif self.voxel_material[x, y, z] != 0:
+            # Most of the volume is empty, so only clear voxels that were lit
+            self.voxel_material[x, y, z] = ti.cast(0, ti.i8)
+            self.voxel_color[x, y, z] = ti.Vector([0, 0, 0], ti.u8)
+            self._voxel_alpha[x, y, z] = ti.cast(0, ti.u8)
+        if y == self.voxel_grid_res - 2:
+            self._voxel_alpha[x, y, z] = ti.cast(255, ti.u8)
+            self.voxel_color[x, y, z] = ti.Vector([0, 0, 0], ti.u8)
+            self.voxel_material[x, y, z] = ti.cast(1, ti.i8)